@@ -0,0 +1,147 @@
+import logging
+import re
+import threading
+import time
+
+import urllib3
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+WATCH_RESTART_DELAY_SECONDS = 5
+RELIST_PAGE_SIZE = 500
+# The apiserver ends each watch after this delay, the watch then resumes from
+# the last resource version
+WATCH_TIMEOUT_SECONDS = 300
+WATCH_CONNECT_TIMEOUT_SECONDS = 10
+# Longer than the server-side timeout, so that only a dead connection hits it
+WATCH_READ_TIMEOUT_SECONDS = WATCH_TIMEOUT_SECONDS + 30
+
+_LABEL_REQUIREMENT = re.compile(r"\s*([A-Za-z0-9._/-]+)\s*==?\s*([A-Za-z0-9._-]*)\s*")
+
+
+def parse_label_selector(label_selector):
+    """Parse an equality-based label selector ("a=b,c=d") into a dict."""
+    selector = {}
+    for requirement in filter(None, label_selector.split(",")):
+        # "!=" and set-based requirements would otherwise be read as equality
+        match = _LABEL_REQUIREMENT.fullmatch(requirement)
+        if not match:
+            raise ValueError(f"Unsupported label selector: {label_selector}")
+        key, value = match.groups()
+        selector[key] = value
+    return selector
+
+
+class InformerStore:
+    """Local cache of one workload kind, kept up to date by a watch.
+
+    The cache is primed with a paginated LIST served from the apiserver watch
+    cache (``resource_version="0"``) and then follows ADDED/MODIFIED/DELETED
+    events, so handlers can look workloads up without an API round-trip.
+    """
+
+    def __init__(self, kind, list_func, label_selector):
+        self.kind = kind
+        self._list_func = list_func
+        self._label_selector = label_selector
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name=f"informer-{self.kind}", daemon=True
+        )
+        self._thread.start()
+
+    def wait_for_sync(self, timeout=None):
+        return self._synced.wait(timeout)
+
+    def list(self, namespace, label_selector):
+        """Return the cached workloads matching the selector.
+
+        The objects are shared with the cache and must not be mutated.
+        """
+        selector = parse_label_selector(label_selector)
+        with self._lock:
+            objects = list(self._objects.get(namespace, {}).values())
+        return [
+            obj
+            for obj in objects
+            if all(
+                (obj.metadata.labels or {}).get(key) == value
+                for key, value in selector.items()
+            )
+        ]
+
+    def _relist(self):
+        objects = {}
+        # Continue tokens carry the snapshot, only the first page can ask for
+        # the watch cache
+        options = {"resource_version": "0", "resource_version_match": "NotOlderThan"}
+        while True:
+            workloads = self._list_func(
+                label_selector=self._label_selector, limit=RELIST_PAGE_SIZE, **options
+            )
+            for obj in workloads.items:
+                namespace, name = obj.metadata.namespace, obj.metadata.name
+                objects.setdefault(namespace, {})[name] = obj
+            if not workloads.metadata._continue:
+                break
+            options = {"_continue": workloads.metadata._continue}
+        with self._lock:
+            self._objects = objects
+        self._synced.set()
+        return workloads.metadata.resource_version
+
+    def _apply(self, event_type, obj):
+        namespace, name = obj.metadata.namespace, obj.metadata.name
+        with self._lock:
+            if event_type == "DELETED":
+                self._objects.get(namespace, {}).pop(name, None)
+            else:
+                self._objects.setdefault(namespace, {})[name] = obj
+
+    def _run(self):
+        resource_version = None
+        while True:
+            resource_version = self._watch(resource_version)
+
+    def _watch(self, resource_version):
+        """Follow the watch from ``resource_version`` until it ends.
+
+        Return the resource version to resume from, None to relist first.
+        """
+        try:
+            if resource_version is None:
+                resource_version = self._relist()
+            for event in watch.Watch().stream(
+                self._list_func,
+                label_selector=self._label_selector,
+                resource_version=resource_version,
+                timeout_seconds=WATCH_TIMEOUT_SECONDS,
+                _request_timeout=(
+                    WATCH_CONNECT_TIMEOUT_SECONDS,
+                    WATCH_READ_TIMEOUT_SECONDS,
+                ),
+            ):
+                obj = event["object"]
+                resource_version = obj.metadata.resource_version
+                self._apply(event["type"], obj)
+        except ApiException as e:
+            if e.status == 410:  # Resource version too old, relist
+                return None
+            logger.error(f"Error watching {self.kind}s: {e}")
+            time.sleep(WATCH_RESTART_DELAY_SECONDS)
+        except urllib3.exceptions.ReadTimeoutError:
+            logger.warning(f"Watch of {self.kind}s timed out, resuming")
+        except Exception as e:
+            logger.error(f"Unexpected error watching {self.kind}s: {e}")
+            resource_version = None
+            time.sleep(WATCH_RESTART_DELAY_SECONDS)
+        return resource_version
@@ -0,0 +1,46 @@
+import kubernetes
+
+# Enough connections for concurrent patches not to queue on a single socket
+API_CONNECTION_POOL_MAXSIZE = 50
+APPLY_PATCH = "application/apply-patch+yaml"
+
+# Shared ApiClient, created once so that every API wrapper reuses its pool
+_api_client = None
+
+
+def load_kube_config():
+    try:
+        kubernetes.config.load_incluster_config()
+    except kubernetes.config.ConfigException:
+        kubernetes.config.load_kube_config()
+
+
+def get_api_client():
+    global _api_client
+    if _api_client is None:
+        load_kube_config()
+        configuration = kubernetes.client.Configuration.get_default_copy()
+        configuration.connection_pool_maxsize = API_CONNECTION_POOL_MAXSIZE
+        _api_client = kubernetes.client.ApiClient(configuration)
+    return _api_client
+
+
+def server_side_apply(path, body, field_manager):
+    """Apply ``body`` to the object at ``path`` and return the applied object.
+
+    The generated ``patch_*`` methods of the client cannot send the apply
+    content type, so the request is made through ``ApiClient.call_api``.
+    """
+    return get_api_client().call_api(
+        path,
+        "PATCH",
+        query_params=[("fieldManager", field_manager), ("force", True)],
+        header_params={
+            "Accept": "application/json",
+            "Content-Type": APPLY_PATCH,
+        },
+        body=body,
+        response_type="object",
+        auth_settings=["BearerToken"],
+        _return_http_data_only=True,
+    )
@@ -1,19 +1,91 @@
-import datetime
+import asyncio
+import collections
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import kopf
 import kubernetes
+import pybreaker
+import urllib3
 from kubernetes.client.rest import ApiException
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_exponential_jitter,
+)
+from informers import InformerStore
+from kube import get_api_client, server_side_apply
 from static_proxy import create_nginx_deployment
 
 # Constants
 LABEL_SELECTOR = "asterius.fr/proxy=true"
 API_RETRY_ATTEMPTS = 3
 API_RETRY_WAIT_SECONDS = 1
-API_RETRY_MULTIPLIER = 2
+API_RETRY_MAX_WAIT_SECONDS = 10
+API_RETRY_JITTER_SECONDS = 2
+API_RETRY_MAX_DELAY_SECONDS = 30
+# Throttling and server-side errors, other failures will not recover on retry
+API_RETRY_STATUSES = (429, 500, 502, 503, 504)
+API_BREAKER_FAIL_MAX = 5
+API_BREAKER_RESET_TIMEOUT_SECONDS = 30
 NGINX_DEPLOYMENT_NAME = "nginx-proxy"
+INFORMER_SYNC_TIMEOUT_SECONDS = 60
+INFORMER_SYNC_RETRY_SECONDS = 10
+PATCH_WORKERS = 8
+FIELD_MANAGER = "swhp-operator"
+FIELD_MANAGER_MAX_LENGTH = 128
+NGINX_CONFIG_CACHE_SIZE = 256
+EVENT_BATCH_WINDOW_SECONDS = 2
+CONFIG_HASH_ANNOTATION = "asterius.fr/config-hash"
+# Longest name part of an annotation key, after the prefix
+ANNOTATION_NAME_MAX_LENGTH = 63
+# Spec fields rendered into the nginx configuration
+NGINX_CONFIG_FIELDS = ("provider", "ingress", "azure", "aws")
+
+# Shared API clients, reused by every handler
+_CORE = kubernetes.client.CoreV1Api(get_api_client())
+_APPS = kubernetes.client.AppsV1Api(get_api_client())
+_NET = kubernetes.client.NetworkingV1Api(get_api_client())
+
+# Workload kinds served by the proxy, with their API resource and their list
+# and patch functions
+WorkloadKind = collections.namedtuple(
+    "WorkloadKind", ["kind", "resource", "list", "patch"]
+)
+_WORKLOAD_KINDS = (
+    WorkloadKind(
+        "Deployment",
+        "deployments",
+        _APPS.list_deployment_for_all_namespaces,
+        _APPS.patch_namespaced_deployment,
+    ),
+    WorkloadKind(
+        "StatefulSet",
+        "statefulsets",
+        _APPS.list_stateful_set_for_all_namespaces,
+        _APPS.patch_namespaced_stateful_set,
+    ),
+    WorkloadKind(
+        "DaemonSet",
+        "daemonsets",
+        _APPS.list_daemon_set_for_all_namespaces,
+        _APPS.patch_namespaced_daemon_set,
+    ),
+)
+_WORKLOAD_KIND_MAP = {
+    workload_kind.kind: workload_kind for workload_kind in _WORKLOAD_KINDS
+}
+
+# Patches matched workloads concurrently, bounded to spare the apiserver
+_patch_executor = ThreadPoolExecutor(max_workers=PATCH_WORKERS)
 
+# Workload caches, populated at operator startup
+workload_stores = {}
 
-def create_ingress(networking_v1_api, namespace, name, host, svc_name):
+
+def apply_ingress(namespace, name, host, svc_name):
 
     body = {
         "apiVersion": "networking.k8s.io/v1",
@@ -47,49 +119,57 @@ def create_ingress(networking_v1_api, namespace, name, host, svc_name):
         },
     }
 
-    # Creation of the Deployment in specified namespace
-    # (Can replace "default" with a namespace you may have created)
-    networking_v1_api.create_namespaced_ingress(namespace, body)
-
+    # Server-side apply creates the Ingress or updates it, so that a retried
+    # create event does not fail on the Ingress created by the first attempt
+    server_side_apply(
+        f"/apis/networking.k8s.io/v1/namespaces/{namespace}/ingresses/{name}",
+        body,
+        FIELD_MANAGER,
+    )
 
-def delete_ingress(client, namespace, name):
-    networking_api = client.NetworkingV1Api()
 
+def delete_ingress(networking_v1_api, namespace, name, logger):
     try:
-        networking_api.delete_namespaced_ingress(name=name, namespace=namespace)
-        print(f"Ingress '{name}' deleted successfully from namespace '{namespace}'")
-    except client.ApiException as e:
-        print(f"Error deleting Ingress '{name}': {e}")
+        networking_v1_api.delete_namespaced_ingress(name=name, namespace=namespace)
+        logger.info(
+            f"Ingress '{name}' deleted successfully from namespace '{namespace}'"
+        )
+    except ApiException as e:
+        logger.error(f"Error deleting Ingress '{name}': {e}")
 
 
 # Utility functions
-def get_nginx_config(spec):
+def get_azure_upstream(azure):
+    account_name: str = azure["accountName"]
+    dns_zone_id: str = azure["dnsZoneId"]
 
-    provider: str = spec["provider"]
-    ingress: str = spec["ingress"]
+    host = f"{account_name}.z{dns_zone_id}.web.core.windows.net"
+    return host, azure.get("subpath", ""), "https"
+
+
+def get_aws_upstream(aws):
+    bucket: str = aws["bucketName"]
+    region: str = aws["region"]
+
+    host = f"{bucket}.s3-website.{region}.amazonaws.com"
+    return host, aws.get("subpath", ""), "http"
 
-    host: str = ""
-    subpath: str = ""
-    protocol: str = "https"
 
-    if provider == "azure":
-        account_name: str = spec["azure"]["accountName"]
-        dns_zone_id: str = spec["azure"]["dnsZoneId"]
+# Upstream (host, subpath, protocol) of each provider, from its spec section
+_PROVIDERS = {"azure": get_azure_upstream, "aws": get_aws_upstream}
 
-        host = f"{account_name}.z{dns_zone_id}.web.core.windows.net"
-        subpath = spec["azure"].get("subpath", "")
-    elif provider == "aws":
-        bucket: str = spec["aws"]["bucketName"]
-        region: str = spec["aws"]["region"]
 
-        host = f"{bucket}.s3-website.{region}.amazonaws.com"
-        subpath = spec["aws"].get("subpath", "")
+def get_upstream(spec):
+    provider: str = spec["provider"]
+
+    if provider not in _PROVIDERS:
+        return "", "", "https"
 
-        protocol = "http"
+    return _PROVIDERS[provider](spec[provider])
 
-    full_host = f"{host}{subpath}".strip("/")
 
-    return f"""
+# Bound format_map of the server block template, built once at import
+_NGINX_TMPL = """
     server {{
         listen 80;
         server_name {ingress};
@@ -104,16 +184,108 @@ def get_nginx_config(spec):
             proxy_redirect {protocol}://{full_host}/ /;
         }}
     }}
-    """
+    """.format_map
+
+
+# Rendered configurations only depend on these primitives, so re-delivered
+# events for an unchanged spec reuse the previous result
+@functools.lru_cache(maxsize=NGINX_CONFIG_CACHE_SIZE)
+def render_nginx_config(ingress, host, subpath, protocol):
+    return _NGINX_TMPL(
+        {
+            "ingress": ingress,
+            "protocol": protocol,
+            "full_host": f"{host}{subpath}".strip("/"),
+            "host": host,
+        }
+    )
+
+
+def get_nginx_config(spec):
+    return render_nginx_config(spec["ingress"], *get_upstream(spec))
+
+
+# Cached manifests are shared between calls and must not be mutated
+@functools.lru_cache(maxsize=NGINX_CONFIG_CACHE_SIZE)
+def get_config_map(name, nginx_config):
+    return {
+        "apiVersion": "v1",
+        "kind": "ConfigMap",
+        "metadata": {"name": f"{name}-nginx-config"},
+        "data": {f"{name}.conf": nginx_config},
+    }
+
+
+def is_retryable(exception):
+    return (
+        isinstance(exception, ApiException) and exception.status in API_RETRY_STATUSES
+    )
+
+
+# Jittered backoff keeps concurrent handlers from retrying in lockstep
+api_retry = retry(
+    retry=retry_if_exception(is_retryable),
+    stop=stop_after_attempt(API_RETRY_ATTEMPTS)
+    | stop_after_delay(API_RETRY_MAX_DELAY_SECONDS),
+    wait=wait_exponential_jitter(
+        initial=API_RETRY_WAIT_SECONDS,
+        max=API_RETRY_MAX_WAIT_SECONDS,
+        jitter=API_RETRY_JITTER_SECONDS,
+    ),
+    reraise=True,
+)
 
 
-def get_config_map(name, _, nginx_config):
-    return kubernetes.client.V1ConfigMap(
-        metadata=kubernetes.client.V1ObjectMeta(name=f"{name}-nginx-config"),
-        data={f"{name}.conf": nginx_config},
+def is_apiserver_failure(exception):
+    return is_retryable(exception) or isinstance(
+        exception, urllib3.exceptions.HTTPError
     )
 
 
+# Opens after repeated apiserver failures so that handlers stop hammering it,
+# client errors and bugs of the operator itself do not count
+_API_BREAKER = pybreaker.CircuitBreaker(
+    fail_max=API_BREAKER_FAIL_MAX,
+    reset_timeout=API_BREAKER_RESET_TIMEOUT_SECONDS,
+    exclude=[lambda e: not is_apiserver_failure(e)],
+)
+
+
+def api_breaker(func):
+    # While the breaker is open, let kopf back off the whole event
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return _API_BREAKER.call(func, *args, **kwargs)
+        except pybreaker.CircuitBreakerError as e:
+            raise kopf.TemporaryError(
+                f"Kubernetes API unavailable: {e}",
+                delay=API_BREAKER_RESET_TIMEOUT_SECONDS,
+            ) from e
+
+    return wrapper
+
+
+def get_config_hash(nginx_config):
+    return hashlib.blake2b(nginx_config.encode(), digest_size=16).hexdigest()
+
+
+def get_bounded_name(base, name, max_length):
+    # Names that would not fit are replaced by a digest, so that every valid
+    # StaticHost name yields a valid key and existing keys stay unchanged
+    bounded_name = f"{base}-{name}"
+    if len(bounded_name) <= max_length:
+        return bounded_name
+    digest = hashlib.blake2b(name.encode(), digest_size=8).hexdigest()
+    return f"{base}-{digest}"
+
+
+def get_config_hash_annotation(name):
+    # Workloads serve several StaticHosts, each one tracks its own hash
+    prefix, _, base = CONFIG_HASH_ANNOTATION.partition("/")
+    return f"{prefix}/{get_bounded_name(base, name, ANNOTATION_NAME_MAX_LENGTH)}"
+
+
 def get_volume(name):
     return kubernetes.client.V1Volume(
         name=f"{name}-nginx-config",
@@ -131,53 +303,125 @@ def get_volume_mount(name):
     )
 
 
-@retry(
-    stop=stop_after_attempt(API_RETRY_ATTEMPTS),
-    wait=wait_exponential(multiplier=API_RETRY_MULTIPLIER, min=API_RETRY_WAIT_SECONDS),
-)
-def patch_workload(apps_api, workload, kind, name, namespace, logger):
-    if kind == "Deployment":
-        apps_api.patch_namespaced_deployment(
-            name=name, namespace=namespace, body=workload
-        )
-    elif kind == "StatefulSet":
-        apps_api.patch_namespaced_stateful_set(
-            name=name, namespace=namespace, body=workload
-        )
-    elif kind == "DaemonSet":
-        apps_api.patch_namespaced_daemon_set(
-            name=name, namespace=namespace, body=workload
-        )
+# Serialized once per StaticHost and shared read-only by every workload manifest
+@functools.lru_cache(maxsize=NGINX_CONFIG_CACHE_SIZE)
+def get_volume_manifests(name):
+    serialize = _APPS.api_client.sanitize_for_serialization
+    return serialize(get_volume(name)), serialize(get_volume_mount(name))
+
+
+@api_breaker
+@api_retry
+def patch_workload(body, kind, name, namespace, logger):
+    # The client sends dict bodies as strategic merge patches
+    _WORKLOAD_KIND_MAP[kind].patch(name=name, namespace=namespace, body=body)
     logger.info(f"Updated {kind} {name}")
 
 
-def process_workload(apps_api, workload, kind, name, namespace, update_func, logger):
-    workload.spec.template.spec.volumes = workload.spec.template.spec.volumes or []
-    workload.spec.template.spec.volumes.append(get_volume(name))
-    for container in workload.spec.template.spec.containers:
-        container.volume_mounts = container.volume_mounts or []
-        container.volume_mounts.append(get_volume_mount(name))
+@api_breaker
+@api_retry
+def apply_workload(body, kind, name, namespace, logger, field_manager):
+    resource = _WORKLOAD_KIND_MAP[kind].resource
+    server_side_apply(
+        f"/apis/apps/v1/namespaces/{namespace}/{resource}/{name}",
+        body,
+        field_manager,
+    )
+    logger.info(f"Applied {kind} {name}")
+
+
+def get_field_manager(name):
+    # Each StaticHost owns its own fields, so that applying the manifest of one
+    # StaticHost never removes the volumes applied for another one
+    return get_bounded_name(FIELD_MANAGER, name, FIELD_MANAGER_MAX_LENGTH)
+
+
+def process_workload(workload, kind, name, namespace, config_hash, logger):
+    # Apply only the fields managed for this StaticHost, re-applying an
+    # unchanged manifest is a no-op for the apiserver
+    volume, volume_mount = get_volume_manifests(name)
+    body = {
+        "apiVersion": "apps/v1",
+        "kind": kind,
+        "metadata": {"name": workload.metadata.name},
+        "spec": {
+            "template": {
+                "metadata": {
+                    "annotations": {get_config_hash_annotation(name): config_hash}
+                },
+                "spec": {
+                    "volumes": [volume],
+                    "containers": [
+                        {
+                            "name": container.name,
+                            "volumeMounts": [volume_mount],
+                        }
+                        for container in workload.spec.template.spec.containers
+                    ],
+                },
+            }
+        },
+    }
     try:
-        update_func(apps_api, workload, kind, workload.metadata.name, namespace, logger)
+        apply_workload(
+            body,
+            kind,
+            workload.metadata.name,
+            namespace,
+            logger,
+            field_manager=get_field_manager(name),
+        )
     except ApiException as e:
         logger.error(f"Error updating {kind} {workload.metadata.name}: {e}")
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def create_config_map(api, namespace, body):
-    try:
-        api.create_namespaced_config_map(namespace=namespace, body=body)
-    except ApiException as e:
-        if e.status != 409:  # Ignore 409 (Conflict) errors
-            raise e
+@api_breaker
+@api_retry
+def apply_config_map(namespace, body):
+    # Server-side apply creates the ConfigMap or updates it in a single call
+    server_side_apply(
+        f"/api/v1/namespaces/{namespace}/configmaps/{body['metadata']['name']}",
+        body,
+        FIELD_MANAGER,
+    )
 
 
-def update_config_map(api, namespace, name, body):
-    try:
-        api.patch_namespaced_config_map(name=name, namespace=namespace, body=body)
-    except ApiException as e:
-        if e.status != 404:  # Ignore 404 (Not Found) errors
-            raise e
+def restart_workload(workload, kind, name, namespace, config_hash, logger):
+    annotation = get_config_hash_annotation(name)
+
+    # Only roll out workloads still running a different configuration
+    annotations = workload.spec.template.metadata.annotations or {}
+    if annotations.get(annotation) == config_hash:
+        return
+
+    # Re-apply the manifest with the new hash to trigger a new rollout
+    process_workload(workload, kind, name, namespace, config_hash, logger)
+
+
+def list_workloads(namespace):
+    # An unsynced cache matches no workload, retry the event once it is primed
+    # instead of reporting success without touching anything
+    unsynced = [
+        kind for kind, store in workload_stores.items() if not store.wait_for_sync(0)
+    ]
+    if unsynced:
+        raise kopf.TemporaryError(
+            f"Workload informers not synced: {', '.join(unsynced)}",
+            delay=INFORMER_SYNC_RETRY_SECONDS,
+        )
+
+    return [
+        (kind, workload)
+        for kind, store in workload_stores.items()
+        for workload in store.list(namespace, LABEL_SELECTOR)
+    ]
+
+
+async def run_blocking(executor, func, *args):
+    # The kubernetes client is blocking, run its calls off the event loop. The
+    # default executor of the loop (None) is shared by all concurrent events
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
 
 
 def get_proxy_service(spec) -> str:
@@ -187,138 +431,171 @@ def get_proxy_service(spec) -> str:
     return NGINX_DEPLOYMENT_NAME
 
 
-@kopf.on.create("asterius.fr", "v1", "statichosts")
-def create_azure_static_host(body, spec, name, namespace, logger, **kwargs):
-    api = kubernetes.client.CoreV1Api()
-    apps_api = kubernetes.client.AppsV1Api()
-    networking_v1_api = kubernetes.client.NetworkingV1Api()
+@kopf.on.startup()
+def configure_settings(settings: kopf.OperatorSettings, **kwargs):
+    # After each event of an object, kopf waits this long for a newer one and
+    # only handles the latest, so a burst of updates is reconciled once. The
+    # window is operator-wide: creates, deletes, StaticProxy events and kopf's
+    # own follow-up events are delayed by it too
+    settings.batching.batch_window = EVENT_BATCH_WINDOW_SECONDS
+
 
+@kopf.on.startup()
+def start_informers(logger, **kwargs):
+    for workload_kind in _WORKLOAD_KINDS:
+        kind = workload_kind.kind
+        workload_stores[kind] = InformerStore(kind, workload_kind.list, LABEL_SELECTOR)
+        workload_stores[kind].start()
+
+    for kind, store in workload_stores.items():
+        if not store.wait_for_sync(INFORMER_SYNC_TIMEOUT_SECONDS):
+            logger.warning(f"{kind} informer not synced after startup")
+
+    logger.info("Workload informers started")
+
+
+@kopf.on.create("asterius.fr", "v1", "statichosts")
+async def create_azure_static_host(body, spec, name, namespace, logger, **kwargs):
     nginx_config = get_nginx_config(spec)
     logger.debug(f"Nginx configuration for {name}:\n{nginx_config}")
 
-    config_map = get_config_map(name, namespace, nginx_config)
-    create_config_map(api, namespace, config_map)
-
-    # Create an Ingress for the StaticHost
-    create_ingress(
-        networking_v1_api, namespace, name, spec["ingress"], get_proxy_service(spec)
+    config_map = get_config_map(name, nginx_config)
+    config_hash = get_config_hash(nginx_config)
+
+    # Only expose the StaticHost once its configuration exists, a failed
+    # ConfigMap apply must not leave an Ingress behind
+    await run_blocking(None, apply_config_map, namespace, config_map)
+    await run_blocking(
+        None,
+        apply_ingress,
+        namespace,
+        name,
+        spec["ingress"],
+        get_proxy_service(spec),
     )
 
     logger.info(f"Creating StaticHost {name}")
 
-    for kind, list_func in [
-        ("Deployment", apps_api.list_namespaced_deployment),
-        ("StatefulSet", apps_api.list_namespaced_stateful_set),
-        ("DaemonSet", apps_api.list_namespaced_daemon_set),
-    ]:
-        try:
-            workloads = list_func(namespace=namespace, label_selector=LABEL_SELECTOR)
-        except ApiException as e:
-            logger.error(f"Error listing {kind}s: {e}")
-            continue
-        for workload in workloads.items:
-            process_workload(
-                apps_api, workload, kind, name, namespace, patch_workload, logger
+    await asyncio.gather(
+        *(
+            run_blocking(
+                _patch_executor,
+                process_workload,
+                workload,
+                kind,
+                name,
+                namespace,
+                config_hash,
+                logger,
             )
+            for kind, workload in list_workloads(namespace)
+        )
+    )
 
     logger.info(f"StaticHost {name} created and Nginx configurations updated")
 
 
 @kopf.on.delete("asterius.fr", "v1", "statichosts")
-def delete_azure_static_host(body, spec, name, namespace, logger, **kwargs):
-    api = kubernetes.client.CoreV1Api()
-    apps_api = kubernetes.client.AppsV1Api()
-
+async def delete_azure_static_host(body, spec, name, namespace, logger, **kwargs):
     config_map_name = f"{name}-nginx-config"
+    annotation = get_config_hash_annotation(name)
+    mount_path = get_volume_mount(name).mount_path
 
     # Function to update a workload
     def update_workload(workload, kind):
-        # Remove the specific volume
-        if workload.spec.template.spec.volumes:
-            workload.spec.template.spec.volumes = [
-                v
-                for v in workload.spec.template.spec.volumes
-                if v.name != config_map_name
-            ]
-
-        # Remove the specific volumeMount from each container
-        for container in workload.spec.template.spec.containers:
-            if container.volume_mounts:
-                container.volume_mounts = [
-                    vm for vm in container.volume_mounts if vm.name != config_map_name
-                ]
+        # Remove the hash annotation, the specific volume and the volumeMount
+        # from each container, list entries are matched by their merge key.
+        # The client sends dict bodies as strategic merge patches. The patch is
+        # sent even if the cached workload lacks these entries, as the cache
+        # may not have seen the apply yet and deleting absent entries is a no-op
+        patch = {
+            "spec": {
+                "template": {
+                    "metadata": {"annotations": {annotation: None}},
+                    "spec": {
+                        "volumes": [{"name": config_map_name, "$patch": "delete"}],
+                        "containers": [
+                            {
+                                "name": container.name,
+                                "volumeMounts": [
+                                    {"mountPath": mount_path, "$patch": "delete"}
+                                ],
+                            }
+                            for container in workload.spec.template.spec.containers
+                        ],
+                    },
+                }
+            }
+        }
 
         try:
-            if kind == "Deployment":
-                apps_api.replace_namespaced_deployment(
-                    name=workload.metadata.name, namespace=namespace, body=workload
-                )
-            elif kind == "StatefulSet":
-                apps_api.replace_namespaced_stateful_set(
-                    name=workload.metadata.name, namespace=namespace, body=workload
-                )
-            elif kind == "DaemonSet":
-                apps_api.replace_namespaced_daemon_set(
-                    name=workload.metadata.name, namespace=namespace, body=workload
-                )
-            logger.info(
-                f"Updated {kind} {workload.metadata.name} to remove configuration for {name}"
+            patch_workload(
+                patch,
+                kind,
+                workload.metadata.name,
+                namespace,
+                logger,
             )
         except kubernetes.client.exceptions.ApiException as e:
             logger.error(f"Error updating {kind} {workload.metadata.name}: {e}")
 
     # Process Deployments, StatefulSets, and DaemonSets
-    for kind, list_func in [
-        ("Deployment", apps_api.list_namespaced_deployment),
-        ("StatefulSet", apps_api.list_namespaced_stateful_set),
-        ("DaemonSet", apps_api.list_namespaced_daemon_set),
-    ]:
-        workloads = list_func(
-            namespace=namespace, label_selector="asterius.fr/proxy=true"
+    await asyncio.gather(
+        *(
+            run_blocking(_patch_executor, update_workload, workload, kind)
+            for kind, workload in list_workloads(namespace)
         )
-        for workload in workloads.items:
-            update_workload(workload, kind)
+    )
 
-    # Delete the ConfigMap
-    try:
-        api.delete_namespaced_config_map(name=config_map_name, namespace=namespace)
-        logger.info(f"Deleted ConfigMap {config_map_name}")
-    except kubernetes.client.exceptions.ApiException as e:
-        if e.status != 404:  # Ignore 404 (Not Found) errors
-            logger.error(f"Error deleting ConfigMap {config_map_name}: {e}")
+    # Delete the ConfigMap and the Ingress concurrently
+    def delete_config_map():
+        try:
+            _CORE.delete_namespaced_config_map(
+                name=config_map_name, namespace=namespace
+            )
+            logger.info(f"Deleted ConfigMap {config_map_name}")
+        except kubernetes.client.exceptions.ApiException as e:
+            if e.status != 404:  # Ignore 404 (Not Found) errors
+                logger.error(f"Error deleting ConfigMap {config_map_name}: {e}")
 
-    delete_ingress(kubernetes.client, namespace, name)
+    await asyncio.gather(
+        run_blocking(None, delete_config_map),
+        run_blocking(None, delete_ingress, _NET, namespace, name, logger),
+    )
 
     logger.info(f"StaticHost {name} deleted and Nginx configurations removed")
 
 
 # On update
-@kopf.on.update("asterius.fr", "v1", "statichosts")
-def update_azure_static_host(body, spec, name, namespace, logger, **kwargs):
-    api = kubernetes.client.CoreV1Api()
-    apps_api = kubernetes.client.AppsV1Api()
+@kopf.on.update("asterius.fr", "v1", "statichosts", field="spec")
+async def update_azure_static_host(body, spec, diff, name, namespace, logger, **kwargs):
+    # Diff paths are relative to the spec, an empty path replaces all of it
+    if not any(not path or path[0] in NGINX_CONFIG_FIELDS for _, path, _, _ in diff):
+        logger.debug(f"StaticHost {name} changes do not affect Nginx configuration")
+        return
 
     nginx_config = get_nginx_config(spec)
     logger.debug(f"Nginx configuration for {name}:\n{nginx_config}")
 
-    config_map = get_config_map(name, namespace, nginx_config)
-    update_config_map(api, namespace, f"{name}-nginx-config", config_map)
-
-    for kind, list_func in [
-        ("Deployment", apps_api.list_namespaced_deployment),
-        ("StatefulSet", apps_api.list_namespaced_stateful_set),
-        ("DaemonSet", apps_api.list_namespaced_daemon_set),
-    ]:
-        workloads = list_func(namespace=namespace, label_selector=LABEL_SELECTOR)
-        for workload in workloads.items:
-            # Update the workload template to trigger a new rollout
-            workload.spec.template.metadata.annotations = {
-                "kubectl.kubernetes.io/restartedAt": datetime.datetime.now().isoformat()
-            }
-
-            patch_workload(
-                apps_api, workload, kind, workload.metadata.name, namespace, logger
+    config_map = get_config_map(name, nginx_config)
+    await run_blocking(None, apply_config_map, namespace, config_map)
+    config_hash = get_config_hash(nginx_config)
+
+    await asyncio.gather(
+        *(
+            run_blocking(
+                _patch_executor,
+                restart_workload,
+                workload,
+                kind,
+                name,
+                namespace,
+                config_hash,
+                logger,
             )
+            for kind, workload in list_workloads(namespace)
+        )
+    )
 
     logger.info(f"StaticHost {name} updated and Nginx configurations updated")
 
@@ -331,7 +608,6 @@ def create_static_proxy(spec, name, namespace, logger, **kwargs):
     create_nginx_deployment(name, namespace, spec)
 
     # Create Service
-    core_v1 = kubernetes.client.CoreV1Api()
     service = kubernetes.client.V1Service(
         metadata=kubernetes.client.V1ObjectMeta(name=name),
         spec=kubernetes.client.V1ServiceSpec(
@@ -339,11 +615,10 @@ def create_static_proxy(spec, name, namespace, logger, **kwargs):
             ports=[kubernetes.client.V1ServicePort(port=80, target_port=80)],
         ),
     )
-    core_v1.create_namespaced_service(namespace, service)
+    _CORE.create_namespaced_service(namespace, service)
 
     # Create Ingress if TLS is enabled
     if spec.get("tls", {}).get("enabled", False):
-        networking_v1 = kubernetes.client.NetworkingV1Api()
         ingress = kubernetes.client.V1Ingress(
             metadata=kubernetes.client.V1ObjectMeta(name=name),
             spec=kubernetes.client.V1IngressSpec(
@@ -375,39 +650,36 @@ def create_static_proxy(spec, name, namespace, logger, **kwargs):
                 ],
             ),
         )
-        networking_v1.create_namespaced_ingress(namespace, ingress)
+        _NET.create_namespaced_ingress(namespace, ingress)
 
     return {"message": f"StaticProxy {name} created successfully"}
 
-@kopf.on.update('asterius.fr', 'v1', 'staticproxies')
+
+@kopf.on.update("asterius.fr", "v1", "staticproxies")
 def update_fn(spec, old, new, name, namespace, logger, **kwargs):
     logger.info(f"Updating StaticProxy: {name}")
-    
+
     logger.info(f"Updating resources for StaticProxy: {name}")
-    apps_v1 = kubernetes.client.AppsV1Api()
-        
+
     # Prepare the patch
     patch = {
         "spec": {
             "template": {
                 "spec": {
-                    "containers": [{
-                        "name": "nginx",
-                        "image": f"nginx:{spec.get('nginxVersion', 'latest')}",
-                        "resources": spec.get("resources", {})
-                    }]
+                    "containers": [
+                        {
+                            "name": "nginx",
+                            "image": f"nginx:{spec.get('nginxVersion', 'latest')}",
+                            "resources": spec.get("resources", {}),
+                        }
+                    ]
                 }
             }
         }
     }
-    
-    # Patch the deployment
-    apps_v1.patch_namespaced_deployment(
-        name=name,
-        namespace=namespace,
-        body=patch
-    )
 
+    # Patch the deployment
+    _APPS.patch_namespaced_deployment(name=name, namespace=namespace, body=patch)
 
 
 @kopf.on.delete("asterius.fr", "v1", "staticproxies")
@@ -415,14 +687,10 @@ def delete_fn(spec, name, namespace, logger, **kwargs):
     logger.info(f"Deleting StaticProxy: {name}")
 
     # Delete associated resources
-    apps_v1 = kubernetes.client.AppsV1Api()
-    core_v1 = kubernetes.client.CoreV1Api()
-    networking_v1 = kubernetes.client.NetworkingV1Api()
-
-    apps_v1.delete_namespaced_deployment(name, namespace)
-    core_v1.delete_namespaced_service(name, namespace)
+    _APPS.delete_namespaced_deployment(name, namespace)
+    _CORE.delete_namespaced_service(name, namespace)
 
     if spec.get("tls", {}).get("enabled", False):
-        networking_v1.delete_namespaced_ingress(name, namespace)
+        _NET.delete_namespaced_ingress(name, namespace)
 
     return {"message": f"StaticProxy {name} deleted successfully"}
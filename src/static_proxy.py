@@ -1,9 +1,11 @@
-from kubernetes import client, config
+from kubernetes import client
+from kube import get_api_client
 
+# Shared API client, reused by every handler
+_APPS = client.AppsV1Api(get_api_client())
 
-def create_nginx_deployment(name, namespace, spec):
-    apps_v1 = client.AppsV1Api()
 
+def create_nginx_deployment(name, namespace, spec):
     container = client.V1Container(
         name="nginx",
         image=f"nginx:{spec.get('nginxVersion', 'latest')}",
@@ -34,4 +36,4 @@ def create_nginx_deployment(name, namespace, spec):
         spec=spec,
     )
 
-    return apps_v1.create_namespaced_deployment(namespace, deployment)
+    return _APPS.create_namespaced_deployment(namespace, deployment)
@@ -0,0 +1,70 @@
+import collections
+import io
+import json
+import os
+import sys
+
+import pytest
+import urllib3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+
+# The operator modules build their API clients at import time, point them to a
+# cluster that is never contacted
+KUBECONFIG = os.path.join(os.path.dirname(__file__), "kubeconfig.yaml")
+os.environ["KUBECONFIG"] = KUBECONFIG
+os.environ.pop("KUBERNETES_SERVICE_HOST", None)
+
+
+class ResponseBody(io.BytesIO):
+    """Response payload that closes itself once read, like a socket."""
+
+    def read(self, *args):
+        data = super().read(*args)
+        if not data:
+            self.close()
+        return data
+
+
+class ApiRequests(list):
+    """HTTP requests sent by the shared ApiClient, in order."""
+
+    def __init__(self):
+        super().__init__()
+        self.responses = collections.deque()
+
+    def respond(self, body, status=200):
+        """Queue the answer to the next request.
+
+        ``body`` is serialized to JSON, a list of events is sent as a watch
+        stream with one event per line.
+        """
+        if isinstance(body, list):
+            data = "".join(json.dumps(event) + "\n" for event in body)
+        else:
+            data = json.dumps(body)
+        self.responses.append((data.encode(), status))
+
+
+@pytest.fixture
+def api_requests(monkeypatch):
+    """Record the HTTP requests sent by the shared ApiClient.
+
+    Requests are answered with the responses queued with ``respond``, then
+    with an empty JSON object.
+    """
+    from kube import get_api_client
+
+    requests = ApiRequests()
+
+    def request(method, url, **kwargs):
+        requests.append(dict(kwargs, method=method, url=url))
+        body, status = (
+            requests.responses.popleft() if requests.responses else (b"{}", 200)
+        )
+        return urllib3.HTTPResponse(
+            body=ResponseBody(body), status=status, preload_content=False
+        )
+
+    monkeypatch.setattr(get_api_client().rest_client.pool_manager, "request", request)
+    return requests
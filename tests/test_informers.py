@@ -0,0 +1,147 @@
+import kubernetes
+import pytest
+import urllib3
+
+from informers import (
+    WATCH_CONNECT_TIMEOUT_SECONDS,
+    WATCH_READ_TIMEOUT_SECONDS,
+    WATCH_TIMEOUT_SECONDS,
+    InformerStore,
+)
+from kube import get_api_client
+
+LABEL_SELECTOR = "asterius.fr/proxy=true"
+
+
+def make_store():
+    apps_api = kubernetes.client.AppsV1Api(get_api_client())
+    return InformerStore(
+        "Deployment", apps_api.list_deployment_for_all_namespaces, LABEL_SELECTOR
+    )
+
+
+def deployment(name, namespace="web", resource_version="1", labels=None):
+    return {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "resourceVersion": resource_version,
+            "labels": {"asterius.fr/proxy": "true"} if labels is None else labels,
+        },
+    }
+
+
+def names(objects):
+    return sorted(obj.metadata.name for obj in objects)
+
+
+def test_watch_is_bounded_and_resumes(api_requests):
+    store = make_store()
+    api_requests.respond(
+        [{"type": "ADDED", "object": deployment("web", resource_version="5")}]
+    )
+
+    assert store._watch("4") == "5"
+
+    (request,) = api_requests
+    params = dict(request["fields"])
+    assert params["watch"] is True
+    assert params["resourceVersion"] == "4"
+    assert params["timeoutSeconds"] == WATCH_TIMEOUT_SECONDS
+    assert request["timeout"].connect_timeout == WATCH_CONNECT_TIMEOUT_SECONDS
+    assert request["timeout"].read_timeout == WATCH_READ_TIMEOUT_SECONDS
+    assert names(store.list("web", LABEL_SELECTOR)) == ["web"]
+
+
+def test_watch_read_timeout_resumes_without_relist(monkeypatch):
+    store = make_store()
+
+    def stream(*args, **kwargs):
+        raise urllib3.exceptions.ReadTimeoutError(None, "/", "read timed out")
+
+    monkeypatch.setattr(kubernetes.watch.Watch, "stream", stream)
+
+    assert store._watch("4") == "4"
+
+
+def page(*items, resource_version="10", _continue=None):
+    metadata = {"resourceVersion": resource_version}
+    if _continue:
+        metadata["continue"] = _continue
+    return {"metadata": metadata, "items": list(items)}
+
+
+def test_relist_paginates_from_watch_cache(api_requests):
+    store = make_store()
+    api_requests.respond(page(deployment("a"), _continue="token"))
+    api_requests.respond(page(deployment("b"), resource_version="11"))
+
+    assert store._relist() == "11"
+
+    first, second = (dict(request["fields"]) for request in api_requests)
+    assert first == {
+        "labelSelector": LABEL_SELECTOR,
+        "limit": 500,
+        "resourceVersion": "0",
+        "resourceVersionMatch": "NotOlderThan",
+    }
+    # Continue tokens carry the snapshot of the first page
+    assert second == {
+        "labelSelector": LABEL_SELECTOR,
+        "limit": 500,
+        "continue": "token",
+    }
+    assert store.wait_for_sync(0)
+    assert names(store.list("web", LABEL_SELECTOR)) == ["a", "b"]
+
+
+def test_watch_relists_on_gone(api_requests):
+    store = make_store()
+    api_requests.respond(page(deployment("stale")))
+    store._relist()
+    api_requests.clear()
+    gone = {"kind": "Status", "code": 410, "reason": "Gone", "message": "too old"}
+    api_requests.respond([{"type": "ERROR", "object": gone}])
+    api_requests.respond(page(deployment("fresh"), resource_version="20"))
+    api_requests.respond([])
+
+    resource_version = store._watch("4")
+    assert resource_version is None
+
+    assert store._watch(resource_version) == "20"
+    relist, watch = (dict(request["fields"]) for request in api_requests[1:])
+    assert "watch" not in relist
+    assert watch["watch"] is True
+    assert watch["resourceVersion"] == "20"
+    assert names(store.list("web", LABEL_SELECTOR)) == ["fresh"]
+
+
+def test_list_filters_namespace_and_labels(api_requests):
+    store = make_store()
+    api_requests.respond(
+        page(
+            deployment("proxied"),
+            deployment("other-namespace", namespace="other"),
+            deployment("unlabeled", labels={}),
+            deployment("disabled", labels={"asterius.fr/proxy": "false"}),
+        )
+    )
+    store._relist()
+    api_requests.respond(
+        [
+            {"type": "ADDED", "object": deployment("added", resource_version="11")},
+            {"type": "DELETED", "object": deployment("proxied", resource_version="12")},
+        ]
+    )
+    store._watch("10")
+
+    assert names(store.list("web", LABEL_SELECTOR)) == ["added"]
+    assert names(store.list("other", LABEL_SELECTOR)) == ["other-namespace"]
+    assert names(store.list("web", "")) == ["added", "disabled", "unlabeled"]
+    assert store.list("missing", LABEL_SELECTOR) == []
+    assert names(store.list("web", "asterius.fr/proxy==true")) == ["added"]
+    for label_selector in ["asterius.fr/proxy!=true", "asterius.fr/proxy in (true)"]:
+        with pytest.raises(ValueError):
+            store.list("web", label_selector)
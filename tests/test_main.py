@@ -0,0 +1,388 @@
+import asyncio
+import json
+import logging
+
+import kopf
+import kubernetes
+import pytest
+import urllib3
+from kubernetes.client.rest import ApiException
+
+import main
+
+
+def test_apply_config_map_uses_server_side_apply(api_requests):
+    config_map = main.get_config_map("site", "server {}")
+
+    main.apply_config_map("web", config_map)
+
+    (request,) = api_requests
+    assert request["method"] == "PATCH"
+    assert request["url"].startswith(
+        "https://kubernetes.invalid/api/v1/namespaces/web/configmaps/site-nginx-config?"
+    )
+    assert "fieldManager=swhp-operator" in request["url"]
+    assert "force=True" in request["url"]
+    assert request["headers"]["Content-Type"] == "application/apply-patch+yaml"
+    assert request["headers"]["authorization"] == "Bearer test"
+    assert json.loads(request["body"]) == config_map
+
+
+def test_apply_ingress_uses_server_side_apply(api_requests):
+    # A retried create event applies the Ingress again instead of creating it
+    main.apply_ingress("web", "site", "site.example.com", "nginx-proxy")
+    main.apply_ingress("web", "site", "site.example.com", "nginx-proxy")
+
+    assert len(api_requests) == 2
+    for request in api_requests:
+        assert request["method"] == "PATCH"
+        assert request["url"].startswith(
+            "https://kubernetes.invalid/apis/networking.k8s.io/v1/namespaces/web/"
+            "ingresses/site?"
+        )
+        assert "fieldManager=swhp-operator" in request["url"]
+        assert request["headers"]["Content-Type"] == "application/apply-patch+yaml"
+    body = json.loads(api_requests[0]["body"])
+    assert body["kind"] == "Ingress"
+    assert body["spec"]["rules"][0]["host"] == "site.example.com"
+
+
+def make_deployment(name="web", containers=("app",), annotations=None):
+    return kubernetes.client.V1Deployment(
+        metadata=kubernetes.client.V1ObjectMeta(
+            name=name, namespace="web", labels={"asterius.fr/proxy": "true"}
+        ),
+        spec=kubernetes.client.V1DeploymentSpec(
+            selector=kubernetes.client.V1LabelSelector(),
+            template=kubernetes.client.V1PodTemplateSpec(
+                metadata=kubernetes.client.V1ObjectMeta(annotations=annotations),
+                spec=kubernetes.client.V1PodSpec(
+                    containers=[
+                        kubernetes.client.V1Container(name=container)
+                        for container in containers
+                    ]
+                ),
+            ),
+        ),
+    )
+
+
+def test_process_workload_uses_server_side_apply(api_requests):
+    logger = logging.getLogger(__name__)
+
+    main.process_workload(
+        make_deployment(),
+        "Deployment",
+        "site",
+        "web",
+        "hash",
+        logger,
+    )
+
+    (request,) = api_requests
+    assert request["method"] == "PATCH"
+    assert request["url"].startswith(
+        "https://kubernetes.invalid/apis/apps/v1/namespaces/web/deployments/web?"
+    )
+    assert "fieldManager=swhp-operator-site" in request["url"]
+    assert request["headers"]["Content-Type"] == "application/apply-patch+yaml"
+    body = json.loads(request["body"])
+    assert body["kind"] == "Deployment"
+    pod_template = body["spec"]["template"]
+    assert pod_template["metadata"]["annotations"] == {
+        "asterius.fr/config-hash-site": "hash"
+    }
+    assert pod_template["spec"]["volumes"] == [
+        {"name": "site-nginx-config", "configMap": {"name": "site-nginx-config"}}
+    ]
+    assert pod_template["spec"]["containers"] == [
+        {
+            "name": "app",
+            "volumeMounts": [
+                {
+                    "name": "site-nginx-config",
+                    "mountPath": "/etc/nginx/conf.d/site.conf",
+                    "subPath": "site.conf",
+                }
+            ],
+        }
+    ]
+
+
+@pytest.mark.parametrize(
+    "kind, resource",
+    [
+        ("Deployment", "deployments"),
+        ("StatefulSet", "statefulsets"),
+        ("DaemonSet", "daemonsets"),
+    ],
+)
+def test_patch_workload(api_requests, kind, resource):
+    body = {"spec": {"template": {"metadata": {"annotations": {"a": None}}}}}
+
+    main.patch_workload(body, kind, "web", "web", logging.getLogger(__name__))
+
+    (request,) = api_requests
+    assert request["method"] == "PATCH"
+    assert request["url"] == (
+        f"https://kubernetes.invalid/apis/apps/v1/namespaces/web/{resource}/web"
+    )
+    assert request["headers"]["Content-Type"] == (
+        "application/strategic-merge-patch+json"
+    )
+    assert json.loads(request["body"]) == body
+
+
+@pytest.fixture
+def api_breaker():
+    main._API_BREAKER.close()
+    yield main._API_BREAKER
+    main._API_BREAKER.close()
+
+
+def raise_(exception):
+    raise exception
+
+
+@pytest.mark.parametrize(
+    "exception",
+    [
+        ApiException(status=503),
+        urllib3.exceptions.MaxRetryError(None, "/", "connection refused"),
+    ],
+)
+def test_api_breaker_opens_on_apiserver_failures(api_breaker, exception):
+    call = main.api_breaker(raise_)
+    for _ in range(main.API_BREAKER_FAIL_MAX):
+        with pytest.raises((type(exception), kopf.TemporaryError)):
+            call(exception)
+
+    assert api_breaker.current_state == "open"
+    with pytest.raises(kopf.TemporaryError):
+        call(exception)
+
+
+@pytest.mark.parametrize(
+    "exception", [ApiException(status=404), TypeError("unexpected argument")]
+)
+def test_api_breaker_ignores_other_errors(api_breaker, exception):
+    call = main.api_breaker(raise_)
+    for _ in range(main.API_BREAKER_FAIL_MAX + 1):
+        with pytest.raises(type(exception)):
+            call(exception)
+
+    assert api_breaker.current_state == "closed"
+
+
+def test_list_workloads_requires_synced_informers(monkeypatch):
+    store = main.InformerStore(
+        "Deployment", main._APPS.list_deployment_for_all_namespaces, main.LABEL_SELECTOR
+    )
+    monkeypatch.setitem(main.workload_stores, "Deployment", store)
+
+    with pytest.raises(kopf.TemporaryError, match="Deployment"):
+        main.list_workloads("web")
+
+
+@pytest.mark.parametrize(
+    "name, annotation",
+    [
+        ("site", "asterius.fr/config-hash-site"),
+        ("s" * 51, f"asterius.fr/config-hash-{'s' * 51}"),
+    ],
+)
+def test_config_hash_annotation(name, annotation):
+    assert main.get_config_hash_annotation(name) == annotation
+
+
+def test_config_hash_annotation_is_bounded():
+    long_names = ["s" * 52, "s" * 253, "t" * 253]
+
+    annotations = [main.get_config_hash_annotation(name) for name in long_names]
+
+    for annotation in annotations:
+        prefix, _, key = annotation.partition("/")
+        assert prefix == "asterius.fr"
+        assert len(key) <= 63
+    assert len(set(annotations)) == len(long_names)
+
+
+def test_field_manager_is_bounded():
+    assert main.get_field_manager("site") == "swhp-operator-site"
+    assert len(main.get_field_manager("s" * 253)) <= 128
+    assert main.get_field_manager("s" * 253) != main.get_field_manager("t" * 253)
+
+
+SPEC = {
+    "provider": "aws",
+    "ingress": "site.example.com",
+    "aws": {"bucketName": "site", "region": "eu-west-3"},
+}
+
+
+@pytest.fixture
+def workloads(api_requests, monkeypatch):
+    """Prime the Deployment cache with the given workloads."""
+    store = main.InformerStore(
+        "Deployment", main._APPS.list_deployment_for_all_namespaces, main.LABEL_SELECTOR
+    )
+    monkeypatch.setattr(main, "workload_stores", {"Deployment": store})
+
+    def prime(*deployments):
+        serialize = main._APPS.api_client.sanitize_for_serialization
+        api_requests.respond(
+            {
+                "metadata": {"resourceVersion": "1"},
+                "items": [serialize(deployment) for deployment in deployments],
+            }
+        )
+        store._relist()
+        api_requests.clear()
+
+    return prime
+
+
+def update_static_host(diff, spec=SPEC):
+    asyncio.run(
+        main.update_azure_static_host(
+            body={},
+            spec=spec,
+            diff=diff,
+            name="site",
+            namespace="web",
+            logger=logging.getLogger(__name__),
+        )
+    )
+
+
+def test_event_batch_window_is_kopf_batch_window():
+    settings = kopf.OperatorSettings()
+
+    main.configure_settings(settings=settings)
+
+    assert settings.batching.batch_window == main.EVENT_BATCH_WINDOW_SECONDS
+
+
+def test_successive_updates_are_not_errors(api_requests, workloads):
+    workloads(make_deployment())
+    diff = [("change", ("ingress",), "old.example.com", SPEC["ingress"])]
+
+    # Coalescing is left to kopf, a handler called twice in a row reconciles
+    # both times instead of failing the second one
+    update_static_host(diff)
+    update_static_host(diff)
+
+    config_map_applies = [
+        request for request in api_requests if "/configmaps/" in request["url"]
+    ]
+    assert len(config_map_applies) == 2
+
+
+@pytest.mark.parametrize("current_hash, applied", [("new", False), ("old", True)])
+def test_restart_workload_skips_unchanged_hash(api_requests, current_hash, applied):
+    annotation = main.get_config_hash_annotation("site")
+    workload = make_deployment(annotations={annotation: current_hash})
+
+    main.restart_workload(
+        workload, "Deployment", "site", "web", "new", logging.getLogger(__name__)
+    )
+
+    assert len(api_requests) == int(applied)
+    if applied:
+        body = json.loads(api_requests[0]["body"])
+        assert body["spec"]["template"]["metadata"]["annotations"] == {
+            annotation: "new"
+        }
+
+
+def test_update_skips_workloads_running_the_config(api_requests, workloads):
+    config_hash = main.get_config_hash(main.get_nginx_config(SPEC))
+    annotation = main.get_config_hash_annotation("site")
+    workloads(
+        make_deployment("current", annotations={annotation: config_hash}),
+        make_deployment("stale", annotations={annotation: "old"}),
+    )
+
+    update_static_host([("change", ("ingress",), "old.example.com", SPEC["ingress"])])
+
+    workload_applies = [
+        request["url"] for request in api_requests if "/deployments/" in request["url"]
+    ]
+    assert len(workload_applies) == 1
+    assert "/deployments/stale?" in workload_applies[0]
+
+
+@pytest.mark.parametrize(
+    "diff, reconciled",
+    [
+        ([("change", ("proxy", "service"), "old", "new")], False),
+        ([("add", ("proxy",), None, {"service": "new"})], False),
+        ([("change", ("ingress",), "old.example.com", SPEC["ingress"])], True),
+        ([("change", ("aws", "region"), "eu-west-1", "eu-west-3")], True),
+        (
+            [
+                ("change", ("proxy", "service"), "old", "new"),
+                ("change", ("provider",), "azure", "aws"),
+            ],
+            True,
+        ),
+        # The whole spec is replaced when it was empty before
+        ([("add", (), None, SPEC)], True),
+    ],
+)
+def test_update_filters_diff_paths(api_requests, workloads, diff, reconciled):
+    workloads(make_deployment())
+
+    update_static_host(diff)
+
+    assert bool(api_requests) == reconciled
+
+
+def test_delete_removes_static_host_entries(api_requests, workloads):
+    workloads(make_deployment(containers=("app", "sidecar")))
+
+    asyncio.run(
+        main.delete_azure_static_host(
+            body={},
+            spec=SPEC,
+            name="site",
+            namespace="web",
+            logger=logging.getLogger(__name__),
+        )
+    )
+
+    patch, *deletes = api_requests
+    assert patch["method"] == "PATCH"
+    assert patch["url"] == (
+        "https://kubernetes.invalid/apis/apps/v1/namespaces/web/deployments/web"
+    )
+    assert patch["headers"]["Content-Type"] == "application/strategic-merge-patch+json"
+    # volumeMounts are merged by mountPath, a directive keyed by name would
+    # be accepted and delete nothing
+    delete_mount = {"mountPath": "/etc/nginx/conf.d/site.conf", "$patch": "delete"}
+    assert json.loads(patch["body"]) == {
+        "spec": {
+            "template": {
+                "metadata": {"annotations": {"asterius.fr/config-hash-site": None}},
+                "spec": {
+                    "volumes": [{"name": "site-nginx-config", "$patch": "delete"}],
+                    "containers": [
+                        {"name": "app", "volumeMounts": [delete_mount]},
+                        {"name": "sidecar", "volumeMounts": [delete_mount]},
+                    ],
+                },
+            }
+        }
+    }
+    assert sorted((request["method"], request["url"]) for request in deletes) == [
+        (
+            "DELETE",
+            "https://kubernetes.invalid/api/v1/namespaces/web/configmaps/"
+            "site-nginx-config",
+        ),
+        (
+            "DELETE",
+            "https://kubernetes.invalid/apis/networking.k8s.io/v1/namespaces/web/"
+            "ingresses/site",
+        ),
+    ]